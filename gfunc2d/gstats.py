@@ -6,12 +6,43 @@ Created on Wed Jan 24 14:19:27 2018
 @author: christian
 """
 
+import functools
+
 import h5py
 import pandas as pd
 import numpy as np
 from scipy.stats import norm
 from scipy.optimize import newton
 from scipy.linalg import block_diag
+from numba import njit, prange
+
+
+@njit(parallel=True, cache=True)
+def _smooth2d_kernel(g):
+    '''
+    Fused 3x3 smoothing stencil with weights outer([.25,.5,.25], [.25,.5,.25])
+    and zero padding at the edges (equivalent to two passes of np.convolve
+    with mode='same', but with a single read and a single write of the array).
+    '''
+    n, m = g.shape
+    g2 = np.empty((n, m))
+    for i in prange(n):
+        for j in range(m):
+            s = 0.0
+            for di in range(-1, 2):
+                ii = i + di
+                if ii < 0 or ii >= n:
+                    continue
+                wi = 0.5 if di == 0 else 0.25
+                for dj in range(-1, 2):
+                    jj = j + dj
+                    if jj < 0 or jj >= m:
+                        continue
+                    wj = 0.5 if dj == 0 else 0.25
+                    s += wi * wj * g[ii, jj]
+            g2[i, j] = s
+
+    return g2
 
 
 def smooth_gfunc2d(g):
@@ -29,14 +60,29 @@ def smooth_gfunc2d(g):
         Smoothed 2D G function.
     '''
 
-    kernel = np.array([0.25, 0.5, 0.25])
-    func = lambda x: np.convolve(x, kernel, mode='same')
-    g1 = np.apply_along_axis(func, 0, g)
-    g2 = np.apply_along_axis(func, 1, g1)
+    g2 = _smooth2d_kernel(np.asarray(g, dtype=np.float64))
 
     return g2
 
 
+@njit(cache=True)
+def _norm_maxone_inplace(flat):
+    '''
+    Find the maximum of a (flattened) G function and divide by it in-place.
+    Returns the maximum; if it is zero the array is left untouched.
+    '''
+    gmax = 0.0
+    for v in flat:
+        if v > gmax:
+            gmax = v
+    if gmax > 0.0:
+        inv = 1.0 / gmax
+        for i in range(flat.size):
+            flat[i] *= inv
+
+    return gmax
+
+
 def norm_gfunc(g, method='maxone'):
     '''
     Normalise G function.
@@ -56,14 +102,13 @@ def norm_gfunc(g, method='maxone'):
         Normalised G function.
     '''
 
-    gmax = np.amax(g)
     if method == 'maxone':
+        gnorm = np.array(g, dtype=np.float64)
+        gmax = _norm_maxone_inplace(gnorm.ravel())
         if gmax == 0:
-            gnorm = np.ones_like(g)
-        else:
-            gnorm = g / np.amax(g)
+            gnorm = np.ones_like(gnorm)
     elif method == 'sumone':
-        if gmax == 0:
+        if np.amax(g) == 0:
             gnorm = np.ones_like(g) / np.size(g)
         else:
             gnorm = g / np.sum(g)
@@ -75,6 +120,34 @@ def norm_gfunc(g, method='maxone'):
     return gnorm
 
 
+@njit(cache=True)
+def _age_reduce_maxone(g):
+    '''
+    Sum a 2D G function over metallicity (axis 1) while tracking the running
+    maximum of the row sums, then normalise the maximum to one. A single pass
+    over g instead of separate sum, max, and divide passes.
+    '''
+    n, m = g.shape
+    g_age = np.empty(n)
+    gmax = 0.0
+    for i in range(n):
+        s = 0.0
+        for j in range(m):
+            s += g[i, j]
+        g_age[i] = s
+        if s > gmax:
+            gmax = s
+    if gmax > 0.0:
+        inv = 1.0 / gmax
+        for i in range(n):
+            g_age[i] *= inv
+    else:
+        for i in range(n):
+            g_age[i] = 1.0
+
+    return g_age
+
+
 def gfunc_age(g, norm=True, norm_method='maxone'):
     '''
     Get the 1D age G function from the 2D G function.
@@ -98,9 +171,13 @@ def gfunc_age(g, norm=True, norm_method='maxone'):
         1D age G function.
     '''
 
-    g_age = np.sum(g, axis=1)
-    if norm:
-        g_age = norm_gfunc(g_age, norm_method)
+    if norm and norm_method == 'maxone' and g.ndim == 2:
+        # Fast path: sum and normalisation fused in a single pass over g
+        g_age = _age_reduce_maxone(np.asarray(g, dtype=np.float64))
+    else:
+        g_age = np.sum(g, axis=1)
+        if norm:
+            g_age = norm_gfunc(g_age, norm_method)
 
     return g_age
 
@@ -169,12 +246,16 @@ def gfunc_age_mode(g_age, age_grid, use_median=False):
     return age_mode
 
 
+@functools.lru_cache(maxsize=32)
 def conf_glim(conf_level):
     '''
     Get the limiting value of a 1D age G function corresponding
     to a certain age confidence level.
     This is calculated assuming that the G function can be approximated
     by a Gaussian.
+    The result is cached since the same few confidence levels (e.g. 0.68,
+    0.90, 0.95) are typically used for every star in a sample; the root
+    finding only runs once per level.
 
     Parameters
     ----------
@@ -226,8 +307,16 @@ def gfunc_age_conf(g_age, age_grid, conf_level=0.68, use_median=False):
         age_high = gfunc_age_quantile(g_age, age_grid, 0.5+conf_level/2)
     else:
         glim = conf_glim(conf_level)
-        ages_lim = age_grid[g_age > glim]
-        age_low, age_high = ages_lim[0], ages_lim[-1]
+        # First and last index with g_age above the limit; np.argmax
+        # short-circuits on the first True instead of materializing the
+        # full boolean-masked array.
+        above = g_age > glim
+        ind_low = np.argmax(above)
+        if not above[ind_low]:
+            raise ValueError('The G function never exceeds the limiting '
+                             'value of the confidence level')
+        ind_high = len(g_age) - 1 - np.argmax(above[::-1])
+        age_low, age_high = age_grid[ind_low], age_grid[ind_high]
 
     if age_low == age_grid[0]:
         age_low = None
@@ -1,12 +1,33 @@
 import h5py
 import numpy as np
 import pandas as pd
-from gfunc2d.gridtools import get_isochrone, get_gridparams
+from numba import njit
+from gfunc2d.gridtools import get_isochrone, get_gridparams, get_afa_arrays,\
+                              load_as_dict
+from gfunc2d.utilities import find_nearest
 
 known_filters = ['J', 'H', 'Ks', #2MASS
                  'u', 'v', 'g', 'r', 'i' ,'z', #SkyMapper
                  'G', 'G_BPbr', 'G_BPft', 'G_RP'] #Gaia (DR2)
 
+
+@njit(cache=True)
+def _interp_iso(q_arr, q_mass, m, out, iv):
+    '''
+    Interpolate the stacked isochrone parameters q_arr (one row per
+    parameter) to the initial mass m and write the result into column iv
+    of out. q_mass must be sorted.
+    '''
+    ip = np.searchsorted(q_mass, m, side='right')
+    if ip == q_mass.size: # m equals q_mass[-1] (can happen by rounding)
+        ip -= 1
+    im = ip - 1
+    # Now q_mass[im] <= m <= q_mass[ip]
+    h = (m - q_mass[im]) / (q_mass[ip] - q_mass[im])
+    for k in range(q_arr.shape[0]):
+        out[k, iv] = (1-h)*q_arr[k, im] + h*q_arr[k, ip]
+
+
 def generate_synth_stars(isogrid, outputfile, t_bursts, ns, feh_params,
                          IMF_alpha=2.35, rand_seed=1, extra_giants=0,
                          force_SFR=False):
@@ -41,7 +62,8 @@ def generate_synth_stars(isogrid, outputfile, t_bursts, ns, feh_params,
         Default is 2.35 (Salpeter IMF).
 
     rand_seed : int, optional
-        Seed for np.random. Ensures that samples can be reproduced.
+        Seed for the random number generator. Ensures that samples can be
+        reproduced.
         Default value is 1.
 
     extra_giants : float, optional
@@ -49,11 +71,19 @@ def generate_synth_stars(isogrid, outputfile, t_bursts, ns, feh_params,
         A number between 0 and 1 setting the final fraction of the total sample
         which will be forced to be giants.
         Default is 0 in which case no extra giants are added.
+
+    force_SFR : bool, optional
+        Retained for backwards compatibility; it has no effect since the
+        initial masses are now drawn from the IMF truncated to the valid
+        mass range of each isochrone, so no stars are discarded for being
+        too massive for their age (which is what force_SFR=True used to
+        enforce by redrawing).
     """
 
-    # This initialises the random number generator to a given state so that
-    # results can be repeated
-    np.random.seed(rand_seed)
+    # A seeded generator ensures that results can be repeated; all draws
+    # below go through this single Generator (whose PCG64 bit generator
+    # fills whole arrays much faster than the legacy np.random functions)
+    rng = np.random.default_rng(rand_seed)
 
     # Settings for the synthetic dataset
     single_burst = True if len(t_bursts.shape) == 1 else False
@@ -77,72 +107,139 @@ def generate_synth_stars(isogrid, outputfile, t_bursts, ns, feh_params,
 
     # Get isochrone parameters and prepare dictionary with real data
     params = get_gridparams(gridfile)[0]
-    data = {}
-    # Prepare arrays for each parameter + the age
-    for param in params + ['age', 'phase']:
-        data[param] = np.zeros(ns)
+    n_param = len(params)
+    # One contiguous array with a row per parameter (+ the age and phase);
+    # data maps the parameter names to row views into it, so the stars can
+    # be interpolated with a single vector operation across all parameters.
+    all_data = np.zeros((n_param + 2, ns))
+    data = {param: all_data[k]
+            for k, param in enumerate(params + ['age', 'phase'])}
 
     iv = 0 # Number of generated stars with valid isochrone
-    ne = 0 # Number of generated stars that have evolved beyond isochrones
     # The evolutionary phase of the current star (simple dwarf or giant)
     phase_i = 0
+
+    # Metallicity and age grid nodes, used to snap the drawn values to the
+    # grid (as get_isochrone would do). Isochrones are cached by the snapped
+    # values since many stars hit the same grid cell, in which case the grid
+    # read and stacking are skipped entirely.
+    alpha_nodes, feh_nodes, age_nodes = get_afa_arrays(gridfile)
+    alpha_use = find_nearest(alpha_nodes, 0.0)
+    iso_cache = {}
+
+    # Restrict the grid nodes to those reachable by the draws (ages within
+    # the bursts, [Fe/H] within 6 sigma of the mean, both padded with one
+    # node so values between the extreme draws and the nodes still snap
+    # correctly) and preload the corresponding isochrones into memory.
+    # Per-star lookups are then pure in-memory accesses, and the grid file
+    # can be closed before the sampling loop.
+    if single_burst:
+        age_min, age_max = t_bursts[0], t_bursts[1]
+    else:
+        age_min, age_max = np.amin(t_bursts[:, 0]), np.amax(t_bursts[:, 1])
+    feh_min, feh_max = feh_mean - 6*feh_disp, feh_mean + 6*feh_disp
+    if np.any(age_nodes <= age_min):
+        age_min = np.amax(age_nodes[age_nodes <= age_min])
+    if np.any(age_nodes >= age_max):
+        age_max = np.amin(age_nodes[age_nodes >= age_max])
+    if np.any(feh_nodes <= feh_min):
+        feh_min = np.amax(feh_nodes[feh_nodes <= feh_min])
+    if np.any(feh_nodes >= feh_max):
+        feh_max = np.amin(feh_nodes[feh_nodes >= feh_max])
+    age_nodes = age_nodes[(age_nodes >= age_min) & (age_nodes <= age_max)]
+    feh_nodes = feh_nodes[(feh_nodes >= feh_min) & (feh_nodes <= feh_max)]
+
+    isodict = load_as_dict(gridfile, (alpha_use, alpha_use),
+                           (feh_nodes[0], feh_nodes[-1]),
+                           (age_nodes[0], age_nodes[-1]))
+    gridfile.close()
+
+    # Local bindings for values used on every iteration of the hot loop
+    # below (saves the repeated global/dict lookups per candidate)
+    _find_nearest = find_nearest
+    age_data = data['age']
+    phase_data = data['phase']
+    n_dwarf = ns*(1-extra_giants)
+    imf_e = 1 - IMF_alpha
+
+    # Candidates are generated in batches; a single RNG call per array
+    # amortizes the numpy dispatch overhead over n_batch candidates.
+    n_batch = 4096
     while iv < ns:
-        # Define true age
+        # Define true ages for a batch of candidates
         if single_burst:
-            age = t_bursts[0] + (t_bursts[1]-t_bursts[0]) * np.random.rand()
-        else:
-            i_burst = np.random.choice(range(n_bursts), p=prob)
-            age = t_bursts[i_burst, 0] +\
-                  (t_bursts[i_burst, 1]-t_bursts[i_burst, 0]) * np.random.rand()
-        feh_test = np.random.normal(feh_mean, feh_disp)
-
-        # Get the isochrone for [Fe/H], age
-        q, afa = get_isochrone(gridfile, 0.0, feh_test, age)
-        iso_age = afa[2] # True age
-
-        # Find indices of lowest model-to-model temperature difference
-        low_inds = np.argsort(np.diff(10**q['logT']))[:5]
-        # Split between dwarf and giant at this index
-        split_ind = int(np.median(low_inds))
-
-        # Set the minimum mass depending on whether a star is forced to be
-        # a giant
-        if iv < ns*(1-extra_giants):
-            # Minimum temperature to include (setting the minimum mass also)
-            Teffmin_dwarf = 5300-500*feh_test
-            idx_dwarf = np.argmin((np.abs(10**q['logT'][:split_ind]-Teffmin_dwarf)))
-            m_min = q['Mini'][idx_dwarf]
-            phase_i = 0
+            age_batch = t_bursts[0] +\
+                        (t_bursts[1]-t_bursts[0]) * rng.random(n_batch)
         else:
-            m_min = q['Mini'][split_ind]
-            phase_i = 1
-
-        m = m_min * np.random.rand()**(-1/(IMF_alpha-1)) # True initial mass
-        q_mass = q['Mini']
-        if force_SFR:
-            while m >= q_mass[-1]: # the mass is too large
-                m = m_min * np.random.rand()**(-1/(IMF_alpha-1)) # try again
-
-        # If initial mass is in the valid range for the age
-        if m < q_mass[-1]:
-            # Interpolate along the isochrone to the given initial mass
-            im = np.where(q_mass <= m)[0][-1]
-            ip = np.where(q_mass > m)[0][0]
-            # Now q_mass[im] <= m < q_mass[ip]
-            h = (m - q_mass[im]) / (q_mass[ip] - q_mass[im])
-            # Save the interpolated isochrone parameters for the chosen model
-            for param in params:
-                data[param][iv] = (1-h)*q[param][im] + h*q[param][ip]
-            data['age'][iv] = iso_age
-            data['phase'][iv] = phase_i
+            i_burst = rng.choice(n_bursts, n_batch, p=prob)
+            age_batch = t_bursts[i_burst, 0] +\
+                        (t_bursts[i_burst, 1]-t_bursts[i_burst, 0]) *\
+                        rng.random(n_batch)
+        feh_batch = rng.normal(feh_mean, feh_disp, n_batch)
+        imf_batch = rng.random(n_batch)
+
+        for i_cand in range(n_batch):
+            if iv == ns:
+                break
+            age = age_batch[i_cand]
+            feh_test = feh_batch[i_cand]
+
+            # Get the isochrone for [Fe/H], age (cached by grid node)
+            age_key = _find_nearest(age_nodes, age)
+            feh_key = _find_nearest(feh_nodes, feh_test)
+            try:
+                q_arr, q_mass, Teff, split_ind = iso_cache[(feh_key, age_key)]
+            except KeyError:
+                q = get_isochrone(isodict, alpha_use, feh_key, age_key)[0]
+                # The isochrone parameters stacked as a (n_param, n_model)
+                # array, plus the columns needed on every iteration
+                q_arr = np.vstack([q[param] for param in params])
+                q_mass = q['Mini']
+                # Effective temperatures of the models, computed once per
+                # isochrone and reused for every star in this grid cell
+                Teff = 10**q['logT']
+                # Find indices of the 5 lowest model-to-model temperature
+                # differences (argpartition selects them in O(N) without
+                # sorting the whole array; their internal order is
+                # irrelevant since only the median is used)
+                low_inds = np.argpartition(np.diff(Teff), 5)[:5]
+                # Split between dwarf and giant at this index
+                split_ind = int(np.median(low_inds))
+                iso_cache[(feh_key, age_key)] = (q_arr, q_mass, Teff,
+                                                 split_ind)
+            iso_age = age_key # True age
+
+            # Set the minimum mass depending on whether a star is forced to be
+            # a giant
+            if iv < n_dwarf:
+                # Minimum temperature to include (setting the minimum mass also)
+                Teffmin_dwarf = 5300-500*feh_test
+                idx_dwarf = np.argmin((np.abs(Teff[:split_ind]-Teffmin_dwarf)))
+                m_min = q_mass[idx_dwarf]
+                phase_i = 0
+            else:
+                m_min = q_mass[split_ind]
+                phase_i = 1
+
+            # True initial mass from inverse-transform sampling of the
+            # power-law IMF, bounded by the valid mass range of the
+            # isochrone. Every draw is accepted, so no stars are discarded
+            # for being too massive for their age.
+            m_max = q_mass[-1]
+            m = (imf_batch[i_cand]*(m_max**imf_e - m_min**imf_e)
+                 + m_min**imf_e)**(1/imf_e)
+
+            # Interpolate along the isochrone to the given initial mass and
+            # save the parameters for the chosen model (compiled kernel:
+            # binary search for the bracketing models plus a lerp across
+            # all parameters)
+            _interp_iso(q_arr, q_mass, m, all_data, iv)
+            age_data[iv] = iso_age
+            phase_data[iv] = phase_i
 
             iv += 1
-        else:
-            ne += 1
 
     print('Number of valid stars = ', iv)
-    print('Number of discarded stars (too massive for the age) = ', ne)
-    gridfile.close()
 
     # Open the file that the synthetic sample is saved in
     outfile = h5py.File(outputfile, 'r+')
@@ -153,10 +250,12 @@ def generate_synth_stars(isogrid, outputfile, t_bursts, ns, feh_params,
             config[cparam] = 'None'
         outfile.create_dataset('config/'+cparam, data=config[cparam])
 
-    # Save the stellar data
+    # Save the stellar data (chunked and compressed; the lzf filter with
+    # byte shuffling cuts file size and read time for large samples)
     for sparam in data:
-        outfile.create_dataset('data/'+sparam,
-                                data=data[sparam])
+        outfile.create_dataset('data/'+sparam, data=data[sparam],
+                               chunks=(min(ns, 65536),),
+                               compression='lzf', shuffle=True)
     outfile.close()
 
 
@@ -194,28 +293,49 @@ def make_synth_obs(synthfile, outputfile, obs_params, plx_distribution=1,
     # Get the 'true' parameters of the synthetic stars
     true_data = {}
     synth_data = h5py.File(synthfile, 'r')
-    ns = synth_data['config/ns'][()]
+    ns = int(synth_data['config/ns'][()])
 
+    # Names of the datasets to read: the observed parameters (with color
+    # indices split into their two magnitudes) plus J and G which, whether
+    # or not they are observed, are used when defining parallax
+    # uncertainties
+    read_params = []
     for oparam in obs_params:
         if oparam == 'plx':
             continue
+        if '-' in oparam:
+            read_params.extend(oparam.split('-'))
+        else:
+            read_params.append(oparam)
+    read_params.extend(['J', 'G'])
+    read_params = list(dict.fromkeys(read_params)) # unique, order kept
+
+    # Read all datasets directly into one preallocated buffer
+    # (read_direct avoids an intermediate allocation per dataset)
+    read_buf = np.empty((len(read_params), ns))
+    raw_data = {}
+    for k, rparam in enumerate(read_params):
         try:
-            if oparam == 'logT':
-                true_data[oparam] = 10**(synth_data['data/'+oparam][:])
-            elif '-' in oparam:
-                (col1, col2) = oparam.split('-')
-                true_data[oparam] = synth_data['data/'+col1][:]-synth_data['data/'+col2][:]
-            else:
-                true_data[oparam] = synth_data['data/'+oparam][:]
-        except:
-            raise KeyError('Problem with parameter ' + oparam + ' (not in synthetic data?)')
-
-    # Whether or not these magnitudes are to be observed, they are loaded
-    # to be used when defining parallax uncertainties
-    J_mag_true = synth_data['data/J'][:]
-    G_mag_true = synth_data['data/G'][:]
+            synth_data['data/'+rparam].read_direct(read_buf[k])
+        except KeyError:
+            raise KeyError('Problem with parameter ' + rparam + ' (not in synthetic data?)')
+        raw_data[rparam] = read_buf[k]
     synth_data.close()
 
+    for oparam in obs_params:
+        if oparam == 'plx':
+            continue
+        if oparam == 'logT':
+            true_data[oparam] = 10**raw_data[oparam]
+        elif '-' in oparam:
+            (col1, col2) = oparam.split('-')
+            true_data[oparam] = raw_data[col1] - raw_data[col2]
+        else:
+            true_data[oparam] = raw_data[oparam]
+
+    J_mag_true = raw_data['J']
+    G_mag_true = raw_data['G']
+
     # If parallaxes are to be fitted, the true values are assumed based on
     # the input plx_distribution
     if 'plx' in obs_params:
@@ -237,60 +357,64 @@ def make_synth_obs(synthfile, outputfile, obs_params, plx_distribution=1,
             app_mags_true[mag] = true_data[mag] + mu_true
         G_app_mag_true = G_mag_true + mu_true
 
-    # Prepare dictionary with observed parameters
-    obs_data = {x: [] for x in obs_params}
-
-    # Make observed data assuming Gaussian uncertainties
-    for oparam in obs_data:
+    # Stack the true values and the Gaussian uncertainty of each parameter
+    # into (n_obs, ns) matrices; the observed data can then be made by
+    # perturbing everything with a single vectorized RNG call.
+    obs_order = list(obs_params)
+    obs_true = np.empty((len(obs_order), ns))
+    obs_sigma = np.empty((len(obs_order), ns))
+    for k, oparam in enumerate(obs_order):
         if oparam in obs_mags:
+            obs_true[k] = app_mags_true[oparam]
             if oparam == 'Ks' and obs_params[oparam][1] == 'mag':
                 Ks_err = np.zeros(ns)
                 for i in range(ns):
                     Ks_err[i] = K_mag_err(app_mags_true[oparam][i])
-                obs_data[oparam] = app_mags_true[oparam]
-                if perturb_true_values:
-                    obs_data[oparam] += np.random.normal(0, Ks_err)
+                obs_sigma[k] = Ks_err
             elif obs_params[oparam][1] == 'abs':
-                obs_data[oparam] = app_mags_true[oparam]
-                if perturb_true_values:
-                    obs_data[oparam] += np.random.normal(0, obs_params[oparam][0], ns)
+                obs_sigma[k] = obs_params[oparam][0]
             else:
-                obs_data[oparam] = app_mags_true[oparam]
-                if perturb_true_values:
-                    obs_data[oparam] += np.random.normal(0, app_mags_true[oparam]*obs_params[oparam][0], ns)
+                obs_sigma[k] = app_mags_true[oparam]*obs_params[oparam][0]
         elif oparam == 'plx' and obs_params[oparam][1] == 'Gaia':
+            obs_true[k] = true_data[oparam]
             plx_true_err = np.zeros(ns)
             for i in range(ns):
                 plx_true_err[i] = SM_parallax_err(G_app_mag_true[i])
-            obs_data[oparam] = true_data[oparam]
-            if perturb_true_values:
-                obs_data[oparam] += np.random.normal(0, plx_true_err)
+            obs_sigma[k] = plx_true_err
         else:
+            obs_true[k] = true_data[oparam]
             if obs_params[oparam][1] == 'abs':
-                obs_data[oparam] = true_data[oparam]
-                if perturb_true_values:
-                    obs_data[oparam] += np.random.normal(0, obs_params[oparam][0], ns)
+                obs_sigma[k] = obs_params[oparam][0]
             else:
-                obs_data[oparam] = true_data[oparam]
-                if perturb_true_values:
-                    obs_data[oparam] += np.random.normal(0, true_data[oparam]*obs_params[oparam][0], ns)
+                obs_sigma[k] = true_data[oparam]*obs_params[oparam][0]
 
-    # Use pandas to organize the data and print it to a text file
-    pd_data = pd.DataFrame.from_dict(obs_data)
-    for i, column in enumerate(list(pd_data)[::-1]):
+    # Make observed data assuming Gaussian uncertainties
+    if perturb_true_values:
+        obs_true += np.random.normal(0.0, 1.0, obs_true.shape) * obs_sigma
+
+    obs_data = {oparam: obs_true[k] for k, oparam in enumerate(obs_order)}
+
+    # Interleave each observed column with its uncertainty column and build
+    # the DataFrame in a single pass (inserting the uncertainty columns one
+    # by one makes pandas reshuffle the whole frame on every insert)
+    ordered_data = {}
+    for column in obs_data:
+        ordered_data[column] = obs_data[column]
         if column == 'Ks' and obs_params[column][1] == 'mag':
-            pd_data.insert(len(obs_data)-i, column+'_unc',
-                           Ks_err)
+            ordered_data[column+'_unc'] = Ks_err
         elif column == 'plx' and obs_params[column][1] == 'Gaia':
-            pd_data.insert(len(obs_data)-i, column+'_unc',
-                           plx_true_err)
+            ordered_data[column+'_unc'] = plx_true_err
+        elif obs_params[column][1] == 'abs':
+            ordered_data[column+'_unc'] = obs_params[column][0]*np.ones(ns)
+        elif column in obs_mags:
+            # Relative to the true absolute magnitude
+            ordered_data[column+'_unc'] = obs_params[column][0]*true_data[column]
         else:
-            if obs_params[column][1] == 'abs':
-                pd_data.insert(len(obs_data)-i, column+'_unc',
-                               obs_params[column][0]*np.ones(ns))
-            else:
-                pd_data.insert(len(obs_data)-i, column+'_unc',
-                               obs_params[column][0]*true_data[column])
+            # Relative to the observed value
+            ordered_data[column+'_unc'] = obs_params[column][0]*obs_data[column]
+
+    # Use pandas to organize the data and print it to a text file
+    pd_data = pd.DataFrame(ordered_data)
     pd_data.to_csv(outputfile, index_label='#sid', sep='\t',
                    float_format='%10.4f')
 